@@ -1,16 +1,24 @@
-from datetime import datetime, timedelta
+from array import array
+from bisect import bisect_right
+from datetime import timedelta
 import os
 import argparse
+import codecs
 import locale
+import logging
 import re
 
 
-SRT_TIME_FORMAT = "%H:%M:%S,%f"  # hours:minutes:seconds,milliseconds
 ARROW = "-->"
 TIME_SEPARATOR = "@"
 LINEAR = "LINEAR"
 TRANSLATION = "TRANSLATION"
 WEIRD_SRT = "This is not a path!"
+BLOCK_SEPARATOR = re.compile(r"\s*\n\s*\n\s*")  # empty line(s) between two subtitles
+TIME = re.compile(r"\d\d:\d\d:\d\d,\d\d\d")
+TIME_LINE = re.compile(r"(\d\d:\d\d:\d\d,\d\d\d)\s*" + ARROW + r"\s*(\d\d:\d\d:\d\d,\d\d\d)")
+
+log = logging.getLogger(__name__)
 
 
 def replace_backslash(s):
@@ -26,37 +34,36 @@ def replace_backslash(s):
         str
 
     """
-    return re.sub('\\\\', '/', s)
+    return s.replace('\\', '/')
 
 
-def linear_function(x0, y0, x1, y1, x):
+def string_to_time(s):
     """
+    Parses an SRT-formatted time string `HH:MM:SS,mmm`.
+
     Parameters
     ----------
-    x0, y0, x1, y1, x : float or datetime.datetime
+    s : str
 
     Returns
     -------
-    float or datetime.datetime
-        Returns the value of linear function trough
-        :math:`(x_0, y_0)` and  :math:`(x_1, y_1)`, in point `x`.
+    int
+        The time in milliseconds.
+
+    See Also
+    --------
+    time_to_string
 
     Examples
     --------
-    >>> linear_function(1, 2, 2, 4, 9)
-    18.0
+    >>> string_to_time('00:02:59,123')
+    179123
 
-    >>> x0 = datetime(2018, 1, 1, 0, 0, 5)
-    >>> y0 = datetime(2018, 1, 1, 0, 0, 6)
-    >>> x1 = datetime(2018, 1, 1, 0, 1, 4)
-    >>> y1 = datetime(2018, 1, 1, 0, 1, 5)
-    >>> x = datetime(2018, 1, 1, 0, 2, 59)
-    >>> linear_function(x0, y0, x1, y1, x)
-    datetime.datetime(2018, 1, 1, 0, 3)
+    >>> string_to_time('01:06:04,245')
+    3964245
 
     """
-    proportion = (x - x0) / (x1 - x0)
-    return proportion * (y1 - y0) + y0
+    return int(s[0:2]) * 3600000 + int(s[3:5]) * 60000 + int(s[6:8]) * 1000 + int(s[9:12])
 
 
 def time_to_string(t):
@@ -65,28 +72,67 @@ def time_to_string(t):
 
     Parameters
     ----------
-    t : datetime
+    t : int
+        The time in milliseconds. Negative times are formatted as
+        `00:00:00,000`, since SRT times cannot be negative.
 
     Returns
     -------
     str
 
+    See Also
+    --------
+    string_to_time
+
     Examples
     --------
-    >>> manipulator.time_to_string(datetime(2018, 1, 1, 0, 2, 59, 123))
+    >>> time_to_string(179000)
     '00:02:59,000'
 
-    >>> manipulator.time_to_string(datetime(2018, 1, 1, 0, 2, 59, 123456))
+    >>> time_to_string(179123)
     '00:02:59,123'
 
-    >>> manipulator.time_to_string(datetime(2018, 1, 1, 0, 2, 59, 12399))
+    >>> time_to_string(179012)
     '00:02:59,012'
 
-    >>> manipulator.time_to_string(datetime(2018, 1, 1, 0, 2, 59, 123999))
-    '00:02:59,123'
+    >>> time_to_string(3964245)
+    '01:06:04,245'
+
+    >>> time_to_string(-500)
+    '00:00:00,000'
+
+    """
+    hours, rest = divmod(max(t, 0), 3600000)
+    minutes, rest = divmod(rest, 60000)
+    seconds, milliseconds = divmod(rest, 1000)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, milliseconds)
 
+
+def times_to_strings(times):
     """
-    return t.strftime(SRT_TIME_FORMAT)[:-3]
+    SRT-formatted string representations of the given times.
+
+    Parameters
+    ----------
+    times : array.array of int or list of int
+        Times (in milliseconds). Negative times are formatted as
+        `00:00:00,000`.
+
+    Returns
+    -------
+    list of str
+
+    See Also
+    --------
+    time_to_string
+
+    Examples
+    --------
+    >>> times_to_strings([179123, 3964245, -500])
+    ['00:02:59,123', '01:06:04,245', '00:00:00,000']
+
+    """
+    return [time_to_string(t) for t in times]
 
 
 def load_srt(srt_file):
@@ -100,53 +146,62 @@ def load_srt(srt_file):
 
     Returns
     -------
-    subs : list of list of object
-        List of subtitles. Every subtitle is described as a list
-
-        `[<number>, [<time start>, <time end>], <first line>, ..., <last line>, <empty line>]`
-
-        of length at least four. Its elements are:
-         - 1st: consecutive number of subtitle (as str)
-         - 2nd: a list, containing the start and the end time
-           of the subtitle, parsed to `datetime` objects
-         - 3rd--(the last but one)-th: lines of the text in the subtitle (as str)
-         - last: the empty string
+    indices : list of str
+        Consecutive numbers of the subtitles.
+    times : array.array of int
+        The start and the end times (in milliseconds) of the subtitles,
+        i.e., `[<start 1>, <end 1>, <start 2>, <end 2>, ...]`.
+    texts : list of list of str
+        Lines of the text in each subtitle.
+    encoding : str
+        The encoding of the file.
 
     Examples
     --------
-    >>> s = load_srt('examples/subs.srt')
-    >>>
+    >>> indices, times, texts, encoding = load_srt('examples/subs.srt')
+    >>> indices
+    ['1', '2']
+    >>> times
+    array('q', [3964245, 3969956, 3970205, 3974881])
 
     """
-    subs = []
-    success = False
-    encodings = [locale.getpreferredencoding(False), "utf-8"]
+    with open(srt_file, "rb") as f:
+        raw = f.read()
+    if raw.startswith(codecs.BOM_UTF8):
+        encodings = ["utf-8-sig"]
+    elif raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encodings = ["utf-16"]
+    else:
+        preferred = codecs.lookup(locale.getpreferredencoding(False)).name
+        encodings = list(dict.fromkeys(["utf-8", preferred]))
+    text = None
     enc = None
     for enc in encodings:
         try:
-            subs = []
-            with open(srt_file, encoding=enc) as f:
-                current = []
-                for line in f:
-                    line_nice = line.strip()
-                    current.append(line_nice)
-                    if not line_nice:
-                        subs.append(current)
-                        current = []
-                if current:
-                    subs.append(current)
-            success = True
+            text = raw.decode(enc)
             break
         except UnicodeDecodeError:
-            print("WARNING: Reading subtitles with encoding", enc, "was not successful.")
-    # convert to datetime objects
-    if success:
-        print("Subtitles", srt_file, "loaded.")
-        for sub in subs:
-            sub[1] = [datetime.strptime(t.strip(), SRT_TIME_FORMAT) for t in sub[1].split(ARROW)]
-        return subs, enc
+            log.info("Reading subtitles with encoding %s was not successful.", enc)
+    if text is not None:
+        # universal newlines, as when reading the file in text mode
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        indices = []
+        times = array("q")
+        texts = []
+        for block in BLOCK_SEPARATOR.split(text.strip()):
+            lines = [line.strip() for line in block.split("\n")]
+            indices.append(lines[0])
+            match = TIME_LINE.search(lines[1])
+            if match is None:
+                message = "Line {} does not contain the start and the end time".format(lines[1])
+                raise Exception(message)
+            times.append(string_to_time(match.group(1)))
+            times.append(string_to_time(match.group(2)))
+            texts.append(lines[2:])
+        log.info("Subtitles %s loaded.", srt_file)
+        return indices, times, texts, enc
     else:
-        print("Specify the right encoding of {}!".format(srt_file))
+        log.error("Specify the right encoding of %s!", srt_file)
         exit(-1)
 
 
@@ -180,19 +235,21 @@ def load_corrections(corrections_file):
 
     Returns
     -------
-    corrected_times : list of list of datetime
-        The elements of `corrected_times` are the pairs of the times
-        specified in the `corrections_file`.
+    wrong : array.array of int
+        The old times (in milliseconds) specified in the `corrections_file`,
+        in increasing order.
+    right : array.array of int
+        The corresponding new times (in milliseconds).
 
     See Also
     --------
     update_times 
-    linear_function
+    interpolate_times
 
     Examples
     --------
-    >>> c = load_corrections('examples/corrections.txt')
-    >>>
+    >>> load_corrections('examples/corrections.txt')
+    (array('q', [3964245, 3970205]), array('q', [3965245, 3972205]))
 
     """
     corrected_times = []
@@ -202,56 +259,114 @@ def load_corrections(corrections_file):
             if TIME_SEPARATOR not in line_nice:
                 message = "Line {} does not contain time separator {}".format(line, TIME_SEPARATOR)
                 raise Exception(message)
-            corrected_times.append([t.strip() for t in line.split(TIME_SEPARATOR)])
-    for i, t_pair in enumerate(corrected_times):
-        corrected_times[i] = [datetime.strptime(t, SRT_TIME_FORMAT) for t in t_pair]
+            t_pair = [t.strip() for t in line_nice.split(TIME_SEPARATOR)]
+            if len(t_pair) != 2 or not all(TIME.fullmatch(t) for t in t_pair):
+                message = "Line {} does not contain two times of the form HH:MM:SS,mmm".format(line_nice)
+                raise Exception(message)
+            corrected_times.append([string_to_time(t) for t in t_pair])
     corrected_times.sort(key=lambda pair: pair[0])
-    return corrected_times
+    for pair0, pair1 in zip(corrected_times, corrected_times[1:]):
+        if pair0[0] == pair1[0]:
+            message = "Old time {} is corrected more than once in {}".format(time_to_string(pair0[0]),
+                                                                             corrections_file)
+            raise Exception(message)
+    wrong = array("q", (pair[0] for pair in corrected_times))
+    right = array("q", (pair[1] for pair in corrected_times))
+    return wrong, right
 
 
-def update_with_sentinels(subs, corrected_times, mode):
+def warn_about_extrapolation(times, wrong):
     """
-    Updates the corrections of the times, so that the times span of corrections
-    contains the time span of the subtitles.
+    Warns if the times span of corrections does not contain the time span
+    of the subtitles, i.e., if `interpolate_times` will extrapolate
+    the first or the last correction segment.
         
     Parameters
     ----------
-    subs : list of list of object
+    times : array.array of int
         As returned by `load_srt`
-    corrected_times : list of list of datetime
-        As returned by `load_corrections`. This list is updated.
-    mode : str
-        Either `LINEAR` or `TRANSLATION`. If LINEAR, `corrected_times` must
-        contain at least two elements to make extrapolation possible.
+    wrong : array.array of int
+        The old times, as returned by `load_corrections`.
     
     Returns
     -------
     None
 
     """
-    dt = corrected_times[0][1] - corrected_times[0][0] if mode == TRANSLATION else timedelta(seconds=2)
-    if subs[0][1][0] < corrected_times[0][0]:
-        if mode == LINEAR:
-            print("WARNING: The first subtitle start ({}) "
-                  "precedes the first corrected value ({}).".format(time_to_string(subs[0][1][0]),
-                                                                    time_to_string(corrected_times[0][0])))
-            print("    Extrapolation will be used at the beginning.")
-        else:
-            sentinel_start = subs[0][1][0]
-            corrected_times.insert(0, [sentinel_start, sentinel_start + dt])
-    if subs[-1][1][1] > corrected_times[-1][1]:
-        if mode == LINEAR:
-            print("WARNING: The last subtitle ({}) "
-                  "ends after the last corrected value ({}).".format(time_to_string(subs[-1][1][1]),
-                                                                     time_to_string(corrected_times[-1][1])))
-            fake_time = subs[-1][1][1] + dt
-            t0_wrong, t0_right = corrected_times[-2]
-            t1_wrong, t1_right = corrected_times[-1]
-            corrected_times.append([fake_time, linear_function(t0_wrong, t0_right, t1_wrong, t1_right, fake_time)])
-            print("    Extrapolation will be used at the end.")
-        else:
-            sentinel_end = subs[-1][1][1]
-            corrected_times.append([sentinel_end, sentinel_end + dt])
+    first, last = min(times), max(times)
+    if first < wrong[0]:
+        log.warning("The first subtitle start (%s) precedes the first corrected value (%s).\n"
+                    "    Extrapolation will be used at the beginning.",
+                    time_to_string(first), time_to_string(wrong[0]))
+    if last > wrong[-1]:
+        log.warning("The last subtitle (%s) ends after the last corrected value (%s).\n"
+                    "    Extrapolation will be used at the end.",
+                    time_to_string(last), time_to_string(wrong[-1]))
+
+
+def interpolate_times(times, wrong, right):
+    """
+    Maps the given times to the corrected ones. The times between
+    two consecutive corrections are mapped via linear function, and
+    the times before the first (or after the last) correction are extrapolated
+    from the first (or the last) two corrections.
+
+    Parameters
+    ----------
+    times : array.array of int or list of int
+        Times (in milliseconds).
+    wrong, right : array.array of int or list of int
+        The old and the new times of the corrections, as returned by
+        `load_corrections`. There must be at least two of them.
+
+    Returns
+    -------
+    list of int
+        The corrected times.
+
+    Examples
+    --------
+    >>> interpolate_times([0, 5, 10, 15], [0, 10, 20], [0, 20, 30])
+    [0, 10, 20, 25]
+
+    >>> interpolate_times([-10, 30, 5], [0, 10, 20], [0, 20, 30])
+    [-20, 40, 10]
+
+    """
+    # differences of the consecutive corrections, computed once per segment
+    dx = [x1 - x0 for x0, x1 in zip(wrong, wrong[1:])]
+    dy = [y1 - y0 for y0, y1 in zip(right, right[1:])]
+    last = len(wrong) - 1
+    new_times = []
+    for t in times:
+        j = max(bisect_right(wrong, t, 0, last) - 1, 0)
+        new_times.append(right[j] + (t - wrong[j]) * dy[j] // dx[j])
+    return new_times
+
+
+def translate_times(times, offset):
+    """
+    Translates the given times by a constant offset.
+
+    Parameters
+    ----------
+    times : array.array of int or list of int
+        Times (in milliseconds).
+    offset : int
+        The offset (in milliseconds).
+
+    Returns
+    -------
+    list of int
+        The translated times.
+
+    Examples
+    --------
+    >>> translate_times([1000, 2500], -500)
+    [500, 2000]
+
+    """
+    return [t + offset for t in times]
 
 
 def update_times(srt_file, corrected_times_file, offset):
@@ -263,7 +378,7 @@ def update_times(srt_file, corrected_times_file, offset):
     Precisely one of the parameters `corrected_times_file` and `offset` must
     be `None`. If the latter is None, the corrections are loaded from the
     specified file `corrected_times_file`. If the former is None,
-    the corrections are computed automatically.
+    all the times are translated by `offset`.
     
     Parameters
     ----------
@@ -271,8 +386,8 @@ def update_times(srt_file, corrected_times_file, offset):
         Path to the file with the original subtitles
     corrected_times_file : str or None
         Path to the file with the suggested corrections of the times
-    offset : float or None
-        Time (in seconds) for which the subtitles should be translated.
+    offset : timedelta or None
+        Time for which the subtitles should be translated.
         Positive values are used when the original subtitles appear too early.
 
     Returns
@@ -283,65 +398,49 @@ def update_times(srt_file, corrected_times_file, offset):
     Examples
     --------
     >>> update_times('examples/subs.srt', 'examples/corrections.txt', None)
-    Subtitles examples/subs.srt loaded.
-    WARNING: The last subtitle (01:06:14,881) ends after the last corrected value (01:06:12,205).
-        Extrapolation will be used at the end.
-    Updated subtitles written to examples/subs_corrections.srt
     'examples/subs_corrections.srt'
 
     >>> update_times('examples/subs.srt', None, timedelta(seconds=2.5))
-    Subtitles examples/subs.srt loaded.
-    Updated subtitles written to examples/subs_plus2point5s.srt
     'examples/subs_plus2point5s.srt'
 
     """
 
     def find_output_name():
-        dot = srt_file.rfind('.')
-        orig_part = srt_file if dot < 0 else srt_file[:dot]
-        appendix = "" if dot < 0 else srt_file[dot:]
+        orig_part, appendix = os.path.splitext(srt_file)
         if mode == LINEAR:
-            slash = corrected_times_file.rfind("/")
-            dot_corrected = corrected_times_file.rfind(".")
-            if dot_corrected > 0:
-                corrected_name = corrected_times_file[slash + 1:dot_corrected]
-            else:
-                corrected_name = corrected_times_file[slash + 1:]
+            corrected_name = os.path.splitext(os.path.basename(corrected_times_file))[0]
             new_part = "_" + corrected_name
         else:
             sign = ["plus", "minus"][offset < timedelta()]
             abs_offset = str(abs(offset).total_seconds())
-            new_part = "_{}{}s".format(sign, re.sub('[.]', 'point', abs_offset))
+            new_part = f"_{sign}{abs_offset.replace('.', 'point')}s"
         return orig_part + new_part + appendix
 
     number_none = (corrected_times_file is None) + (offset is None)
     assert number_none == 1
-    subs, encoding = load_srt(srt_file)
+    indices, times, texts, encoding = load_srt(srt_file)
     if corrected_times_file is None:
         mode = TRANSLATION
-        now = datetime.now()
-        corrected_times = [[now, now + offset]]
+        new_times = translate_times(times, round(offset.total_seconds() * 1000))
     else:
         mode = LINEAR
-        corrected_times = load_corrections(corrected_times_file)
-    if mode == LINEAR and len(corrected_times) < 2:
-        print("ERROR:  Need at lest two corrected time points, but have", len(corrected_times))
-        exit(-1)
-    update_with_sentinels(subs, corrected_times, mode)
+        wrong, right = load_corrections(corrected_times_file)
+        if len(wrong) < 2:
+            log.error("Need at least two corrected time points, but have %d", len(wrong))
+            exit(-1)
+        warn_about_extrapolation(times, wrong)
+        new_times = interpolate_times(times, wrong, right)
     # update
     srt_file_out = find_output_name()
-    which_pair = 0
-    with open(srt_file_out, "w", encoding=encoding) as f:
-        for sub in subs:
-            for i, t in enumerate(sub[1]):
-                while t > corrected_times[which_pair + 1][0]:
-                    which_pair += 1
-                t0_wrong, t0_right = corrected_times[which_pair]
-                t1_wrong, t1_right = corrected_times[which_pair + 1]
-                sub[1][i] = time_to_string(linear_function(t0_wrong, t0_right, t1_wrong, t1_right, t))
-            sub[1] = "{} {} {}".format(sub[1][0], ARROW, sub[1][1])
-            print("\n".join(sub), file=f)
-    print("Updated subtitles written to", srt_file_out)
+    new_times = times_to_strings(new_times)
+    subs = zip(indices, new_times[::2], new_times[1::2], texts)
+    output = "\n\n".join("\n".join([index, f"{start} {ARROW} {end}", *text])
+                           for index, start, end, text in subs) + "\n"
+    if os.linesep != "\n":
+        output = output.replace("\n", os.linesep)
+    with open(srt_file_out, "wb") as f:
+        f.write(output.encode(encoding))
+    log.info("Updated subtitles written to %s", srt_file_out)
     return srt_file_out
 
 
@@ -355,12 +454,15 @@ if __name__ == "__main__":
                         help='number of seconds for which the subtitles should be moved, e.g., '
                              '2.5 (if the subtitles are 2.5 seconds too early) or '
                              '-3 (if the subtitles are 3 seconds too late)')
+    parser.add_argument('-quiet', dest='quiet', action='store_true',
+                        help='print only warnings and errors')
     is_ok = True
     args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format="%(levelname)s: %(message)s")
     # subtitles file
     srt_path = args.srt_path
     if not (os.path.exists(srt_path) and os.path.isfile(srt_path)):
-        print("ERROR: The specified srt file", srt_path, "does not exist.")
+        log.error("The specified srt file %s does not exist.", srt_path)
         is_ok = False
     srt_path = replace_backslash(srt_path)
     # corrections file
@@ -374,11 +476,11 @@ if __name__ == "__main__":
     # sanity check
     nb_none = (corrections_path is None) + (offset_value is None)
     if nb_none != 1:
-        print("ERROR: Precisely one of the options -cor and -off must be specified.")
+        log.error("Precisely one of the options -cor and -off must be specified.")
         is_ok = False
 
     if is_ok:
         update_times(srt_path, corrections_path, offset_value)
     else:
-        print("Nothing will happen ... Here is some help:\n")
+        log.error("Nothing will happen ... Here is some help:\n")
         parser.print_help()